@@ -1,29 +1,67 @@
 import torch
+import torch.fx
 import torch.nn as nn
 import torch.nn.functional as F
+import torch.utils.checkpoint
 
 # UNet code is from https://github.com/milesial/Pytorch-UNet/blob/master/unet/unet_parts.py
 
 # Part of code (positional encoding part) is from https://github.com/diolatzis/active-exploration
 
+# Input shapes are fixed per scene, so let cuDNN autotune conv algorithms once
+torch.backends.cudnn.benchmark = True
+
 # Shared Components
 
 class DoubleConv(nn.Module):
-    """(convolution => [BN] => ReLU) * 2"""
+    """(convolution => BN => ReLU) * 2; fuse() folds the BNs away for inference"""
 
-    def __init__(self, in_channels, out_channels, mid_channels=None):
+    def __init__(self, in_channels, out_channels, mid_channels=None, separable=False, activation='relu'):
         super().__init__()
         if not mid_channels:
             mid_channels = out_channels
-        self.double_conv = nn.Sequential(
-            nn.Conv2d(in_channels, mid_channels, kernel_size=3, padding=1, bias=False),
-            nn.ReLU(inplace=True),
-            nn.Conv2d(mid_channels, out_channels, kernel_size=3, padding=1, bias=False),
-            nn.ReLU(inplace=True)
-        )
+        self.separable = separable
+        if separable:
+            # MobileNet-style factorization of each 3x3: depthwise 3x3 + pointwise 1x1,
+            # ~9x fewer FLOPs at the 256-512 channel stages
+            self.double_conv = nn.Sequential(
+                nn.Conv2d(in_channels, in_channels, kernel_size=3, padding=1, groups=in_channels, bias=False),
+                make_activation(activation),
+                nn.Conv2d(in_channels, mid_channels, kernel_size=1, bias=False),
+                make_activation(activation),
+                nn.Conv2d(mid_channels, mid_channels, kernel_size=3, padding=1, groups=mid_channels, bias=False),
+                make_activation(activation),
+                nn.Conv2d(mid_channels, out_channels, kernel_size=1, bias=False),
+                make_activation(activation),
+            )
+            return
+        # bias is enabled so the fused kernel can fold the bias add into the conv epilogue
+        self.conv1 = nn.Conv2d(in_channels, mid_channels, kernel_size=3, padding=1, bias=True)
+        self.bn1 = nn.BatchNorm2d(mid_channels)
+        self.conv2 = nn.Conv2d(mid_channels, out_channels, kernel_size=3, padding=1, bias=True)
+        self.bn2 = nn.BatchNorm2d(out_channels)
+        self.act = make_activation(activation)
 
     def forward(self, x):
-        return self.double_conv(x)
+        if self.separable:
+            return self.double_conv(x)
+        if self.bn1 is None:
+            # post-fuse(): BN statistics live in the conv, take the fused conv+act path
+            x = conv2d_act(x, self.conv1, self.act)
+            return conv2d_act(x, self.conv2, self.act)
+        x = self.act(self.bn1(self.conv1(x)))
+        return self.act(self.bn2(self.conv2(x)))
+
+    def fuse(self):
+        """Fold each BatchNorm into its conv (eval/inference only)."""
+        if self.separable:
+            return self
+        if self.bn1 is not None:
+            fold_bn(self.conv1, self.bn1)
+            fold_bn(self.conv2, self.bn2)
+            self.bn1 = None
+            self.bn2 = None
+        return self
 
 
 class Down(nn.Module):
@@ -46,27 +84,52 @@ class Up(nn.Module):
     def __init__(self, in_channels, out_channels, bilinear=True):
         super().__init__()
 
-        # if bilinear, use the normal convolutions to reduce the number of channels
+        # a 1x1 conv followed by pixel shuffle (depth-to-space) upsamples without ever
+        # materializing a bilinear-interpolated intermediate; channel count is preserved
         if bilinear:
-            self.up = nn.Upsample(scale_factor=2, mode='bilinear', align_corners=True)
+            self.up = nn.Sequential(
+                nn.Conv2d(in_channels // 2, in_channels * 2, kernel_size=1),
+                nn.PixelShuffle(2)
+            )
             self.conv = DoubleConv(in_channels, out_channels, in_channels // 2)
         else:
             self.up = nn.ConvTranspose2d(in_channels, in_channels // 2, kernel_size=2, stride=2)
             self.conv = DoubleConv(in_channels, out_channels)
+        # set True when spatial dims are known to align (power-of-two inputs):
+        # skips the size-dependent pad branch, which also makes the graph
+        # symbolically traceable
+        self.static_shape = False
 
     def forward(self, x1, x2):
         x1 = self.up(x1)
+        if self.static_shape:
+            return self.conv(torch.cat([x2, x1], dim=1))
         # input is CHW
         diffY = x2.size()[2] - x1.size()[2]
         diffX = x2.size()[3] - x1.size()[3]
 
-        x1 = F.pad(x1, [diffX // 2, diffX - diffX // 2,
-                        diffY // 2, diffY - diffY // 2])
+        # write x2 and the (padded) x1 straight into the concat buffer instead of
+        # materializing a separate pad tensor and then cat'ing
         # if you have padding issues, see
         # https://github.com/HaiyongJiang/U-Net-Pytorch-Unstructured-Buggy/commit/0e854509c2cea854e247a9c615f175f76fbb2e3a
         # https://github.com/xiaopeng-liao/Pytorch-UNet/commit/8ebac70e633bac59fc22bb5195e513d5832fb3bd
-        x = torch.cat([x2, x1], dim=1)
-        return self.conv(x)
+        c2 = x2.size(1)
+        # allocate the buffer in the skip's memory format: if the encoder ran
+        # channels_last, the concat stays channels_last and the following conv
+        # avoids a re-layout copy
+        fmt = torch.channels_last if x2.is_contiguous(memory_format=torch.channels_last) \
+            else torch.contiguous_format
+        out = torch.empty((x2.size(0), c2 + x1.size(1), x2.size(2), x2.size(3)),
+                          dtype=x2.dtype, device=x2.device, memory_format=fmt)
+        out.narrow(1, 0, c2).copy_(x2)
+        x1_dst = out.narrow(1, c2, x1.size(1))
+        if diffX == 0 and diffY == 0:
+            x1_dst.copy_(x1)
+        else:
+            x1_dst.zero_()
+            x1_dst[:, :, diffY // 2:diffY // 2 + x1.size(2),
+                   diffX // 2:diffX // 2 + x1.size(3)].copy_(x1)
+        return self.conv(out)
 
 
 class OutConv(nn.Module):
@@ -78,11 +141,12 @@ class OutConv(nn.Module):
         return self.conv(x)
 
 class UNet(nn.Module):
-    def __init__(self, n_channels, n_classes, bilinear=True):
+    def __init__(self, n_channels, n_classes, bilinear=True, checkpointing=False):
         super(UNet, self).__init__()
         self.n_channels = n_channels
         self.n_classes = n_classes
         self.bilinear = bilinear
+        self.checkpointing = checkpointing
 
         self.inc = (DoubleConv(n_channels, 32))
         self.down1 = (Down(32, 64))
@@ -96,25 +160,36 @@ class UNet(nn.Module):
         self.up4 = (Up(64, 32, bilinear))
         self.outc = (OutConv(32, n_classes))
 
+        if checkpointing:
+            # checkpointed blocks re-run their forward during backward, updating
+            # BN running stats twice per step; compensate their momentum so the
+            # effective update rate matches the uncheckpointed net (set the flag
+            # at construction, not by mutating the attribute later)
+            for block in (self.inc, self.down1, self.up3, self.up4):
+                compensate_bn_momentum(block)
+
     def forward(self, x):
-        x1 = self.inc(x)
-        x2 = self.down1(x1)
+        # checkpoint only the full-resolution blocks, where activations dominate memory
+        ckpt = self.checkpointing and self.training
+        x1 = checkpointed(self.inc, ckpt, x)
+        x2 = checkpointed(self.down1, ckpt, x1)
         x3 = self.down2(x2)
         x4 = self.down3(x3)
         x5 = self.down4(x4)
         x = self.up1(x5, x4)
         x = self.up2(x, x3)
-        x = self.up3(x, x2)
-        x = self.up4(x, x1)
+        x = checkpointed(self.up3, ckpt, x, x2)
+        x = checkpointed(self.up4, ckpt, x, x1)
         logits = self.outc(x)
         return logits
 
 class ThreeWayUNet(nn.Module):
-    def __init__(self, n_channels, n_classes, bilinear=True):
+    def __init__(self, n_channels, n_classes, bilinear=True, checkpointing=False):
         super(ThreeWayUNet, self).__init__()
         self.n_channels = n_channels
         self.n_classes = n_classes
         self.bilinear = bilinear
+        self.checkpointing = checkpointing
 
         self.inc = (DoubleConv(n_channels, 32))
         self.down1 = (Down(32, 64))
@@ -122,70 +197,56 @@ class ThreeWayUNet(nn.Module):
         self.down3 = (Down(128, 256))
         factor = 2 if bilinear else 1
         self.down4 = (Down(256, 512 // factor))
-        
-        
-        self.up_group_1_0 = (Up(512, 256 // factor, bilinear))
-        self.up_group_1_1 = (Up(256, 128 // factor, bilinear))
-        self.up_group_1_2 = (Up(128, 64 // factor, bilinear))
-        self.up_group_1_3 = (Up(64, 32, bilinear))
-        self.up_group_1_4 = (OutConv(32, 3))
-
-        self.up_group_2_0 = (Up(512, 256 // factor, bilinear))
-        self.up_group_2_1 = (Up(256, 128 // factor, bilinear))
-        self.up_group_2_2 = (Up(128, 64 // factor, bilinear))
-        self.up_group_2_3 = (Up(64, 32, bilinear))
-        self.up_group_2_4 = (OutConv(32, n_classes))
-
-        self.up_group_3_0 = (Up(512, 256 // factor, bilinear))
-        self.up_group_3_1 = (Up(256, 128 // factor, bilinear))
-        self.up_group_3_2 = (Up(128, 64 // factor, bilinear))
-        self.up_group_3_3 = (Up(64, 32, bilinear))
-        self.up_group_3_4 = (OutConv(32, 2))                    
+
+        # single decoder trunk shared by the three output branches; the per-branch
+        # 1x1 heads stay distinct
+        self.up1 = (Up(512, 256 // factor, bilinear))
+        self.up2 = (Up(256, 128 // factor, bilinear))
+        self.up3 = (Up(128, 64 // factor, bilinear))
+        self.up4 = (Up(64, 32, bilinear))
+        # the three 1x1 heads read the same shared features, so run them as one
+        # conv and split the channels afterwards
+        self.out_head = (OutConv(32, 3 + n_classes + 2))
+
+        if checkpointing:
+            # see UNet: keep BN stats unbiased under the double forward pass
+            for block in (self.inc, self.down1, self.up3, self.up4):
+                compensate_bn_momentum(block)
 
 
     def forward(self, x):
-        x1 = self.inc(x)
-        x2 = self.down1(x1)
+        # checkpoint only the full-resolution blocks, where activations dominate memory
+        ckpt = self.checkpointing and self.training
+        x1 = checkpointed(self.inc, ckpt, x)
+        x2 = checkpointed(self.down1, ckpt, x1)
         x3 = self.down2(x2)
         x4 = self.down3(x3)
         x5 = self.down4(x4)
-        
-        out1 = self.up_group_1_0(x5, x4)
-        out1 = self.up_group_1_1(out1, x3)
-        out1 = self.up_group_1_2(out1, x2)
-        out1 = self.up_group_1_3(out1, x1)
-        out1 = self.up_group_1_4(out1)
-
-        out2 = self.up_group_2_0(x5, x4)
-        out2 = self.up_group_2_1(out2, x3)
-        out2 = self.up_group_2_2(out2, x2)
-        out2 = self.up_group_2_3(out2, x1)
-        out2 = self.up_group_2_4(out2)
-
-        out3 = self.up_group_3_0(x5, x4)
-        out3 = self.up_group_3_1(out3, x3)
-        out3 = self.up_group_3_2(out3, x2)
-        out3 = self.up_group_3_3(out3, x1)
-        out3 = self.up_group_3_4(out3)
+
+        x = self.up1(x5, x4)
+        x = self.up2(x, x3)
+        x = checkpointed(self.up3, ckpt, x, x2)
+        x = checkpointed(self.up4, ckpt, x, x1)
 
         # normal, oi, uv
-        return out1, out2, out3
+        out = self.out_head(x)
+        return torch.split(out, [3, self.n_classes, 2], dim=1)
     
     
 class RNet(nn.Module):
-    def __init__(self,in_channel,out_channel):
+    def __init__(self,in_channel,out_channel,activation='leaky_relu'):
         super(RNet, self).__init__()
         self.layer0 = nn.Sequential(
             nn.Conv2d(in_channel, 32, kernel_size=5,padding=2),
-            nn.LeakyReLU(inplace=True),
+            make_activation(activation),
         )
         self.layer1 = nn.Sequential(
             nn.Conv2d(32, 64, kernel_size=3,padding=1),
-            nn.LeakyReLU(inplace=True),
+            make_activation(activation),
         )
         self.layer2 = nn.Sequential(
             nn.Conv2d(64, 32, kernel_size=3,padding=1),
-            nn.LeakyReLU(inplace=True),
+            make_activation(activation),
         )
         self.layer3 = nn.Sequential(
             nn.Conv2d(32, out_channel, kernel_size=1)
@@ -198,29 +259,18 @@ class RNet(nn.Module):
         return x
     
 class TNetBackBone(nn.Module):
-    def __init__(self,in_channel, out_channel):
+    def __init__(self,in_channel, out_channel, activation='relu'):
         super(TNetBackBone, self).__init__()
-        self.layer1 = nn.Sequential(
-            nn.Conv2d(in_channel, 64, kernel_size=3,padding=1),
-            nn.ReLU(inplace=True),
-        )
-        self.layer2 = nn.Sequential(
-            nn.Conv2d(64, 128, kernel_size=3,padding=1),
-            nn.ReLU(inplace=True),
-        )
-        self.layer3 = nn.Sequential(
-            nn.Conv2d(128, 64, kernel_size=3,padding=1),
-            nn.ReLU(inplace=True),
-        )
-        self.layer4 = nn.Sequential(
-            nn.Conv2d(64, out_channel, kernel_size=1),
-            nn.ReLU(inplace=True),
-        )
+        self.layer1 = nn.Conv2d(in_channel, 64, kernel_size=3,padding=1)
+        self.layer2 = nn.Conv2d(64, 128, kernel_size=3,padding=1)
+        self.layer3 = nn.Conv2d(128, 64, kernel_size=3,padding=1)
+        self.layer4 = nn.Conv2d(64, out_channel, kernel_size=1)
+        self.act = make_activation(activation)
     def forward(self, x):
-        x = self.layer1(x)
-        x = self.layer2(x)
-        x = self.layer3(x)
-        x = self.layer4(x)
+        x = conv2d_act(x, self.layer1, self.act)
+        x = conv2d_act(x, self.layer2, self.act)
+        x = conv2d_act(x, self.layer3, self.act)
+        x = conv2d_act(x, self.layer4, self.act)
         return x
 class TNet(nn.Module):
     def __init__(self,in_channel,hidden=32):
@@ -229,50 +279,233 @@ class TNet(nn.Module):
         self.tnet_b = TNetBackBone(hidden,16)
         self.hidden = hidden
     def forward(self, g,rx):
-        num_of_glass = g.shape[1]
-        r_shape = (g.shape[0],self.hidden,g.shape[-2],g.shape[-1])
-        result = torch.zeros(r_shape,device="cuda")
-        for i in range(num_of_glass):
-            result = result + self.tnet_f(torch.cat([rx, g[:,i,...]], 1) )
+        # fold the glass dimension into the batch so all glasses run through
+        # tnet_f as one large conv call instead of num_of_glass small ones
+        b, num_of_glass = g.shape[0], g.shape[1]
+        h, w = g.shape[-2], g.shape[-1]
+        rx_tiled = rx.unsqueeze(1).expand(-1, num_of_glass, -1, -1, -1).reshape(b * num_of_glass, rx.shape[1], h, w)
+        g_flat = g.reshape(b * num_of_glass, g.shape[2], h, w)
+        fused_in = torch.cat([rx_tiled, g_flat], 1).contiguous(memory_format=torch.channels_last)
+        result = self.tnet_f(fused_in).reshape(b, num_of_glass, self.hidden, h, w).sum(dim=1)
         result = self.tnet_b(result)
         return result
 
 class CNet(nn.Module):
-    def __init__(self,n_oi):
+    def __init__(self,n_oi,checkpointing=False):
         super(CNet, self).__init__()
-        self.inner_pos = fc_layer(in_features=3, out_features=16)
-        self.unet = UNet(37,8)
+        # per-pixel Linear over channels == 1x1 conv, but the conv stays in NCHW/NHWC
+        # and avoids the two moveaxis transposes the Linear needed
+        self.inner_pos = nn.Sequential(nn.Conv2d(3, 16, kernel_size=1), nn.LeakyReLU(inplace=True))
+        self.unet = UNet(37,8,checkpointing=checkpointing)
         self.tnet = TNet(8 + 17)
-        self.r_unet = ThreeWayUNet(24,n_oi)
+        self.r_unet = ThreeWayUNet(24,n_oi,checkpointing=checkpointing)
         self.rnet_uv = RNet(2,2)
         self.rnet_normal = RNet(3,3)
+        # toggled off for paths that cannot carry autocast state (FX tracing)
+        self.autocast = True
+        # CUDA Graph capture must run with the autocast weight cache off: cached
+        # casts are freed when the cache clears, leaving a replayed graph reading
+        # reusable memory
+        self.autocast_cache = True
     def forward(self, x,g):
-        position = x[:,4:7, :, :]
-        position = torch.moveaxis(position, 1, 3)
-        
-        pe = self.inner_pos(position)
-        pe = torch.moveaxis(pe, 3, 1)
-        x = torch.cat([x, pe], 1)
-        rx = self.unet(x)
-        tx = self.tnet(g,rx)
-        rtx = torch.cat([rx, tx], 1)
-        normal, oi, uv = self.r_unet(rtx)
-        uv = self.rnet_uv(uv)
-        normal = self.rnet_normal(normal)
-        return normal, oi, uv
+        # NHWC layout dispatches to the tensor-core conv kernels on Ampere+
+        x = x.contiguous(memory_format=torch.channels_last)
+        # BF16 autocast halves activation bandwidth and enables tensor cores for
+        # training and inference forwards alike; master weights remain FP32
+        with torch.autocast(device_type='cuda', dtype=torch.bfloat16,
+                            enabled=self.autocast and torch.cuda.is_available(),
+                            cache_enabled=self.autocast_cache):
+            pe = self.inner_pos(x[:, 4:7])
+            x = torch.cat([x, pe], 1)
+            rx = self.unet(x)
+            tx = self.tnet(g,rx)
+            rtx = torch.cat([rx, tx], 1)
+            normal, oi, uv = self.r_unet(rtx)
+            uv = self.rnet_uv(uv)
+            normal = self.rnet_normal(normal)
+        # outputs go straight into the losses, so cast back to full precision
+        return normal.float(), oi.float(), uv.float()
     
 
 class CrystalNet(nn.Module):
-    def __init__(self,n_oi):
+    def __init__(self,n_oi,compile_model=False,checkpointing=False):
         super(CrystalNet, self).__init__()
-        self.cnet = CNet(n_oi)
-        
+        self.cnet = CNet(n_oi,checkpointing=checkpointing)
+        self.to(memory_format=torch.channels_last)
+        if compile_model:
+            # inductor fuses the pad/cat/relu chains in Up.forward into far fewer kernels;
+            # opt-in because compiled modules save state_dict keys under _orig_mod.
+            self.cnet = torch.compile(self.cnet, mode='reduce-overhead', fullgraph=False)
+
     def forward(self, x,g):
         n,o,d = self.cnet(x,g)
         return n,o,d
 
+    @torch.inference_mode()
+    def infer(self, x, g):
+        """Inference-only forward: skips autograd bookkeeping entirely."""
+        return self.cnet(x, g)
+
+    def fuse(self):
+        """Fold all DoubleConv BatchNorms into their convs for inference."""
+        self.eval()
+        for m in self.cnet.modules():
+            if isinstance(m, DoubleConv):
+                m.fuse()
+        return self
+
+    @staticmethod
+    def prepare_inputs(x, g, device=None, copy_stream=None):
+        """Pin and asynchronously copy an input batch to the GPU.
+
+        Pinned host memory lets the H2D copies run with non_blocking=True so
+        they overlap with compute instead of serializing the step. Pass a
+        dedicated copy_stream to prefetch the next batch while the current
+        forward runs; the helper orders the current stream after the copies and
+        records the tensors on it, so they are safe to use (and free) without
+        further synchronization. device defaults to cuda when available, cpu
+        otherwise.
+        """
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        if not torch.cuda.is_available():
+            return x.to(device), g.to(device)
+        if not x.is_cuda:
+            x = x.pin_memory()
+        if not g.is_cuda:
+            g = g.pin_memory()
+        if copy_stream is not None:
+            with torch.cuda.stream(copy_stream):
+                x = x.to(device, non_blocking=True)
+                g = g.to(device, non_blocking=True)
+            # order the consuming stream after the copies, and tell the caching
+            # allocator the tensors are used there -- otherwise their memory is
+            # considered free on copy_stream and can be handed to the next
+            # prefetched batch while main-stream kernels are still reading it
+            torch.cuda.current_stream().wait_stream(copy_stream)
+            x.record_stream(torch.cuda.current_stream())
+            g.record_stream(torch.cuda.current_stream())
+            return x, g
+        return x.to(device, non_blocking=True), g.to(device, non_blocking=True)
+
+    def quantize(self, calibration_loader):
+        """Post-training INT8 quantization via FX graph mode.
+
+        Quantized kernels run on the CPU backends, so the model is moved to the
+        CPU and its BatchNorms folded first; autocast is switched off and the
+        decoders are pinned to their shape-static path so CNet traces cleanly
+        (requires the usual power-of-two tile sizes). Observers then collect
+        ranges on the calibration batches (per-channel weight, per-tensor
+        activation scales) before conversion. The loader should yield
+        (x, g, ...) batches like the training DataLoaders.
+        """
+        from torch.ao.quantization import get_default_qconfig_mapping
+        from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+        self.cpu()
+        self.fuse()
+        self.cnet.autocast = False
+        for m in self.cnet.modules():
+            if isinstance(m, Up):
+                m.static_shape = True
+        example_x, example_g = [t.cpu() for t in next(iter(calibration_loader))[:2]]
+        prepared = prepare_fx(self.cnet, get_default_qconfig_mapping(), (example_x, example_g))
+        with torch.no_grad():
+            for batch in calibration_loader:
+                prepared(batch[0].cpu(), batch[1].cpu())
+        self.cnet = convert_fx(prepared)
+        return self
+
+    def make_graphed(self, example_x, example_g):
+        """Capture the forward pass as a CUDA Graph for fixed input shapes.
+
+        Replaying the graph replaces hundreds of per-op kernel launches with a
+        single launch. Requires CUDA inputs and static shapes: every later call
+        must match the example batch's shape (TNet is already shape-static since
+        the glass loop was folded into the batch).
+        """
+        # the autocast cache would be captured into the graph and then freed on
+        # cache clear, so capture (and replay) with caching off
+        self.cnet.autocast_cache = False
+        self.cnet = torch.cuda.make_graphed_callables(self.cnet, (example_x, example_g))
+
+    def export_trt(self, example_x, example_g, onnx_path=None):
+        """Compile the network with TensorRT for deployment.
+
+        TNet folds the glass dimension into the batch, so the graph is
+        shape-static; the exported engine is fixed to example_g's glass count
+        and spatial dims. If torch_tensorrt is not installed, falls back to an
+        ONNX export when onnx_path is given.
+        """
+        self.eval()
+        try:
+            import torch_tensorrt
+        except ImportError:
+            if onnx_path is None:
+                raise
+            torch.onnx.export(self, (example_x, example_g), onnx_path,
+                              input_names=["x", "g"], output_names=["normal", "oi", "uv"])
+            return None
+        return torch_tensorrt.compile(
+            self,
+            inputs=[torch_tensorrt.Input(example_x.shape), torch_tensorrt.Input(example_g.shape)],
+            enabled_precisions={torch.bfloat16, torch.float16},
+        )
+
 
 # Helper Layers
 
-def fc_layer(in_features, out_features):
-    return nn.Sequential(nn.Linear(in_features, out_features), nn.LeakyReLU(inplace=True))
+def compensate_bn_momentum(block):
+    """Adjust BN momentum for blocks whose forward runs twice per step.
+
+    Activation checkpointing recomputes the block during backward, so the
+    running stats update twice; two updates with momentum m' equal one update
+    with the configured momentum m when 1 - (1 - m')**2 == m.
+    """
+    for m in block.modules():
+        if isinstance(m, nn.BatchNorm2d):
+            m.momentum = 1.0 - (1.0 - m.momentum) ** 0.5
+
+def checkpointed(block, use_checkpoint, *args):
+    """Run block under activation checkpointing when enabled and grad is on."""
+    if use_checkpoint and torch.is_grad_enabled():
+        return torch.utils.checkpoint.checkpoint(block, *args, use_reentrant=False)
+    return block(*args)
+
+@torch.no_grad()
+def fold_bn(conv, bn):
+    """Fold BatchNorm statistics into the preceding conv's weight and bias."""
+    scale = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+    conv.weight.mul_(scale.view(-1, 1, 1, 1))
+    conv.bias.copy_((conv.bias - bn.running_mean) * scale + bn.bias)
+
+def make_activation(name):
+    """Build an activation module by name: 'relu', 'leaky_relu' or 'silu'."""
+    if name == 'relu':
+        return nn.ReLU(inplace=True)
+    if name == 'leaky_relu':
+        return nn.LeakyReLU(inplace=True)
+    if name == 'silu':
+        return nn.SiLU(inplace=True)
+    raise ValueError(f"unsupported activation: {name}")
+
+def conv2d_act(x, conv, act):
+    """Conv2d followed by an activation, fused into a single cuDNN call for ReLU.
+
+    cuDNN only fuses ReLU into the conv epilogue and the fused kernel has no
+    backward, so the fused path is taken for ReLU with autograd off; everything
+    else (training, SiLU/LeakyReLU) runs the eager conv + activation, where
+    torch.compile can fuse the conv-bias-silu pattern instead.
+    """
+    if isinstance(act, nn.ReLU) and not isinstance(x, torch.fx.Proxy) \
+            and x.is_cuda and not torch.is_grad_enabled():
+        weight, bias = conv.weight, conv.bias
+        if torch.is_autocast_enabled():
+            # the raw aten op has no Autocast registration, so apply the
+            # autocast dtype ourselves instead of silently running FP32
+            dtype = torch.get_autocast_gpu_dtype()
+            x, weight, bias = x.to(dtype), weight.to(dtype), bias.to(dtype)
+        return torch.ops.aten.cudnn_convolution_relu(
+            x, weight, bias,
+            conv.stride, conv.padding, conv.dilation, conv.groups)
+    return act(conv(x))
@@ -159,7 +159,7 @@ class TNet(nn.Module):
     def forward(self, g,rx):
         num_of_glass = g.shape[1]
         r_shape = (g.shape[0],self.hidden,g.shape[-2],g.shape[-1])
-        result = torch.zeros(r_shape,device="cuda")
+        result = torch.zeros(r_shape,device=g.device,dtype=g.dtype)
         for i in range(num_of_glass):
             result = result + self.tnet_f(torch.cat([rx, g[:,i,...]], 1) )
         result = self.tnet_b(result)
@@ -1,7 +1,12 @@
+import os
 import time
+import contextlib
 import numpy as np
 import torch
+import torch.distributed
+from torch.nn.parallel import DistributedDataParallel
 from torch.utils.data import DataLoader, TensorDataset
+from torch.utils.data.distributed import DistributedSampler
 import argparse
 import logging
 from sklearn.model_selection import train_test_split
@@ -10,7 +15,7 @@ from utils import DL1Combine, save_checkpoint, load_checkpoint
 from net_models import CrystalNet as RBufferGenerator
 import torch.optim.lr_scheduler
 
-def load_data(ds_name,obj_num, batch_size, res=256, test_size=0.03, random_seed=42):
+def load_data(ds_name,obj_num, batch_size, res=256, test_size=0.03, random_seed=42, distributed=False):
     """Loads and splits the dataset into train and validation sets."""
     # Load data
     G = torch.load(f"./datasets/{ds_name}/{ds_name}_RAOV_Xg_{res}.pt")
@@ -48,31 +53,46 @@ def load_data(ds_name,obj_num, batch_size, res=256, test_size=0.03, random_seed=
     dataset_tr = TensorDataset(Xtr,Gtr,Rtr[:,-3:,...],Rtr[:,0,...],Rtr[:,1:3,...])
     dataset_va = TensorDataset(Xva,Gva,Rva[:,-3:,...],Rva[:,0,...],Rva[:,1:3,...])
     
-    # DataLoader creation
-    dataloader_train = DataLoader(dataset_tr, batch_size=batch_size, shuffle=True)
+    # DataLoader creation (under DDP each rank gets its own shard of the training set)
+    if distributed:
+        dataloader_train = DataLoader(dataset_tr, batch_size=batch_size,
+                                      sampler=DistributedSampler(dataset_tr, shuffle=True))
+    else:
+        dataloader_train = DataLoader(dataset_tr, batch_size=batch_size, shuffle=True)
     dataloader_val = DataLoader(dataset_va, batch_size=batch_size, shuffle=False)
     
     return dataloader_train, dataloader_val
 
-def train_model(net, dataloader_train, dataloader_val, optimizer, scheduler, criterion, num_epochs, device, ds_name):
+def train_model(net, dataloader_train, dataloader_val, optimizer, scheduler, criterion, num_epochs, device, ds_name, accum_steps=1):
     """Main training loop."""
     net.train()
     for epoch in range(num_epochs):
+        if isinstance(getattr(dataloader_train, "sampler", None), DistributedSampler):
+            dataloader_train.sampler.set_epoch(epoch)
         total_loss = 0
-        for x_raw, g, sn,oi,uv in dataloader_train:
+        optimizer.zero_grad()
+        for step, (x_raw, g, sn,oi,uv) in enumerate(dataloader_train):
             x, g = x_raw.to(device), g.to(device)
             oi = oi.to(device).long()
             uv = uv.to(device)
             sn = sn.to(device)
-            optimizer.zero_grad()
-            
-            # Forward pass
-            pred_sn,pred_oi,pred_uv = net(x, g)
-            loss = criterion(pred_sn,pred_oi,pred_uv,sn,oi,uv)
-            
-            # Backward pass
-            loss.backward()
-            optimizer.step()
+
+            # Under DDP, only all-reduce gradients on accumulation boundaries;
+            # no_sync() skips the per-micro-batch communication entirely
+            boundary = (step + 1) % accum_steps == 0 or (step + 1) == len(dataloader_train)
+            sync_ctx = net.no_sync() if isinstance(net, DistributedDataParallel) and not boundary \
+                else contextlib.nullcontext()
+
+            with sync_ctx:
+                # Forward pass
+                pred_sn,pred_oi,pred_uv = net(x, g)
+                loss = criterion(pred_sn,pred_oi,pred_uv,sn,oi,uv)
+
+                # Backward pass
+                (loss / accum_steps).backward()
+            if boundary:
+                optimizer.step()
+                optimizer.zero_grad()
             total_loss += loss.item()
         
         avg_loss = total_loss / len(dataloader_train)
@@ -82,13 +102,17 @@ def train_model(net, dataloader_train, dataloader_val, optimizer, scheduler, cri
         # Validation and Checkpointing
         if epoch % 10 == 0:
             val_loss = evaluate_model(net, dataloader_val, criterion, device)
+            # evaluate_model switches to eval mode; restore train mode so BN
+            # stats keep updating and activation checkpointing stays active
+            net.train()
             logging.info(f"Validation Loss: {val_loss:.4f}")
 
-        # Save model checkpoints
-        if epoch % 20 == 0:
+        # Save model checkpoints (rank 0 only under DDP, without the module. prefix)
+        is_ddp = isinstance(net, DistributedDataParallel)
+        if epoch % 20 == 0 and (not is_ddp or torch.distributed.get_rank() == 0):
             save_checkpoint({
                 'epoch': epoch,
-                'model_state_dict': net.state_dict(),
+                'model_state_dict': (net.module if is_ddp else net).state_dict(),
                 'optimizer_state_dict': optimizer.state_dict(),
             }, checkpoint_dir="./models", filename=f"{ds_name}_checkpoint_epoch_{epoch}.pth")
 
@@ -124,27 +148,39 @@ def main():
     parser.add_argument('--num_idx', type=int, required=True)
     parser.add_argument('--single_batch_size', type=int, default=3)
     parser.add_argument('--num_epochs', type=int, default=100)
+    parser.add_argument('--accum_steps', type=int, default=1, help="Micro-batches per optimizer step")
     args = parser.parse_args()
     
     # Logging Configuration
     logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
     
-    # Device Configuration
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    # Device Configuration (torchrun sets LOCAL_RANK for multi-GPU runs)
+    local_rank = int(os.environ.get("LOCAL_RANK", -1))
+    distributed = local_rank >= 0
+    if distributed:
+        torch.cuda.set_device(local_rank)
+        torch.distributed.init_process_group(backend="nccl")
+        device = torch.device("cuda", local_rank)
+    else:
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     logging.info(f'Device: {device}')
-    
-    # Load Data
-    batch_size = torch.cuda.device_count() * args.single_batch_size
-    dataloader_train, dataloader_val = load_data(args.scene_name,args.num_idx, batch_size)
+
+    # Load Data (batch size is per rank under DDP)
+    batch_size = args.single_batch_size if distributed else torch.cuda.device_count() * args.single_batch_size
+    dataloader_train, dataloader_val = load_data(args.scene_name,args.num_idx, batch_size, distributed=distributed)
 
     # Model, Optimizer, Scheduler, and Criterion
     net = RBufferGenerator(args.num_idx+1).to(device)
+    if distributed:
+        # static_graph holds: the forward has no data-dependent control flow
+        net = DistributedDataParallel(net, device_ids=[local_rank], gradient_as_bucket_view=True,
+                                      bucket_cap_mb=50, static_graph=True)
     optimizer = torch.optim.AdamW(net.parameters(), lr=1.0e-4, weight_decay=0.0005)
     scheduler = torch.optim.lr_scheduler.StepLR(optimizer, step_size=120, gamma=0.9)
     criterion = DL1Combine()
     
     # Training Loop
-    train_model(net, dataloader_train, dataloader_val, optimizer, scheduler, criterion, args.num_epochs, device, args.scene_name)
+    train_model(net, dataloader_train, dataloader_val, optimizer, scheduler, criterion, args.num_epochs, device, args.scene_name, args.accum_steps)
 
 if __name__ == "__main__":
     main()